@@ -3,5 +3,7 @@ from .config import load_config, save_config, modify_config
 from .database import create_connection, create_new_connection
 from .sync import sync_tables, process_table
 from .utils import get_primary_key, get_existing_columns, get_table_structure, get_table_collation, get_row_checksum, get_table_row_count, has_table_changed, export_csv, import_csv, compress_and_copy_table, batch
+from .changelog import install_changelog_triggers, remove_changelog_triggers
+from .snapshot import export_snapshot, import_snapshot
 from .logging import setup_logging
 from .signal_handler import setup_signal_handler
@@ -0,0 +1,118 @@
+import logging
+import traceback
+import sys
+from mysql.connector import Error
+from termcolor import colored
+from .retry import execute_with_retry
+from .database import get_primary_key_columns, get_table_structure
+
+CHANGELOG_TABLE = 'dbsyncy_changelog'
+TRIGGER_PREFIX = 'dbsyncy_'
+KEY_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint', 'char', 'varchar')
+
+def log_error():
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
+    error_message = f"{exc_type.__name__} - {exc_value}\n" + "".join(tb)
+    print(colored(error_message, 'red'))
+    logging.error(error_message)
+
+def trigger_name(table_name, operation):
+    return f"{TRIGGER_PREFIX}{table_name}_{operation}"[:64]
+
+def create_changelog_table(connection):
+    execute_with_retry(connection, f"""
+        CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} (
+            id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+            table_name VARCHAR(64) NOT NULL,
+            pk_value VARCHAR(255) NOT NULL,
+            operation CHAR(1) NOT NULL,
+            PRIMARY KEY (id),
+            KEY table_id (table_name, id)
+        ) ENGINE=InnoDB
+    """, "Error creating changelog table")
+
+def changelog_triggers_installed(connection, table_name):
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.triggers
+            WHERE trigger_schema=DATABASE() AND event_object_table=%s AND trigger_name IN (%s, %s, %s)
+        """, (table_name, trigger_name(table_name, 'insert'), trigger_name(table_name, 'update'),
+              trigger_name(table_name, 'delete')))
+        return cursor.fetchone()[0] == 3
+    except Error as e:
+        log_error()
+        return False
+
+def changelog_primary_key(connection, table_name):
+    primary_key_columns = get_primary_key_columns(connection, table_name)
+    if len(primary_key_columns) != 1:
+        # Entries hold a single key value, a partial composite key cannot identify the changed row
+        print(colored(f"Changelog capture needs a single-column primary key, {table_name} is synced by full scan", 'yellow'))
+        logging.warning(f"Changelog capture needs a single-column primary key, {table_name} is synced by full scan")
+        return None
+    primary_key = primary_key_columns[0]
+    key_type = (get_table_structure(connection, table_name) or {}).get(primary_key, '').lower().split('(')[0]
+    if key_type not in KEY_TYPES:
+        # Keys are stored as text and matched against fetched rows by their string form, which only
+        # round-trips for integer and character keys
+        print(colored(f"Changelog capture needs an integer or character primary key, {table_name} is synced by full scan", 'yellow'))
+        logging.warning(f"Changelog capture needs an integer or character primary key, {table_name} is synced by full scan")
+        return None
+    return primary_key
+
+def install_changelog_triggers(connection, table_name):
+    try:
+        primary_key = changelog_primary_key(connection, table_name)
+        if not primary_key:
+            return False
+        create_changelog_table(connection)
+        log_change = f"INSERT INTO {CHANGELOG_TABLE} (table_name, pk_value, operation) VALUES ('{table_name}', {{key}}, '{{operation}}')"
+        triggers = {
+            'insert': log_change.format(key=f'NEW.{primary_key}', operation='I'),
+            # A primary key change is logged as a delete of the old key and an update of the new one
+            'update': f"""BEGIN
+                IF NOT (OLD.{primary_key} <=> NEW.{primary_key}) THEN
+                    {log_change.format(key=f'OLD.{primary_key}', operation='D')};
+                END IF;
+                {log_change.format(key=f'NEW.{primary_key}', operation='U')};
+            END""",
+            'delete': log_change.format(key=f'OLD.{primary_key}', operation='D')
+        }
+        for operation, body in triggers.items():
+            name = trigger_name(table_name, operation)
+            execute_with_retry(connection, f"DROP TRIGGER IF EXISTS {name}", f"Error dropping trigger {name}")
+            execute_with_retry(connection, f"CREATE TRIGGER {name} AFTER {operation.upper()} ON {table_name} FOR EACH ROW {body}",
+                               f"Error creating trigger {name}")
+        print(colored(f"Installed changelog triggers on {table_name}", 'green'))
+        logging.info(f"Installed changelog triggers on {table_name}")
+        return True
+    except Error as e:
+        log_error()
+        return False
+
+def remove_changelog_triggers(connection, table_name):
+    try:
+        for operation in ('insert', 'update', 'delete'):
+            name = trigger_name(table_name, operation)
+            execute_with_retry(connection, f"DROP TRIGGER IF EXISTS {name}", f"Error dropping trigger {name}")
+        execute_with_retry(connection, f"DELETE FROM {CHANGELOG_TABLE} WHERE table_name=%s",
+                           f"Error purging changelog for {table_name}", params=(table_name,))
+        print(colored(f"Removed changelog triggers from {table_name}", 'green'))
+        logging.info(f"Removed changelog triggers from {table_name}")
+    except Error as e:
+        log_error()
+
+def read_changelog(connection, table_name, after_id, limit):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT id, pk_value FROM {CHANGELOG_TABLE} WHERE table_name=%s AND id > %s ORDER BY id LIMIT %s",
+                   (table_name, after_id, limit))
+    return cursor.fetchall()
+
+def purge_changelog(connection, table_name, ids):
+    # Only the entries that were read are purged; ids are not committed in order, so an entry with a
+    # lower id can still appear after a drain and must survive for the next one
+    placeholders = ', '.join(['%s'] * len(ids))
+    execute_with_retry(connection, f"DELETE FROM {CHANGELOG_TABLE} WHERE table_name=%s AND id IN ({placeholders})",
+                       f"Error purging changelog for {table_name}", params=(table_name, *ids))
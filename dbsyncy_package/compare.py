@@ -0,0 +1,125 @@
+import datetime
+import decimal
+import json
+import logging
+import re
+from termcolor import colored
+
+def parse_type_arguments(column_type):
+    match = re.search(r'\(([\d,\s]+)\)', column_type)
+    if not match:
+        return []
+    return [int(argument) for argument in match.group(1).split(',')]
+
+def is_case_insensitive(collation):
+    return bool(collation) and (collation.endswith('_ci') or '_ci_' in collation)
+
+def is_pad_space(collation):
+    # MySQL 8 UCA 9.0.0 collations (_0900_) are NO PAD, older collations ignore trailing spaces
+    return bool(collation) and '_0900_' not in collation and not collation.endswith('_nopad_bin')
+
+def float_normalizer(significant_digits):
+    return lambda value: float(f"{float(value):.{significant_digits}g}")
+
+def decimal_normalizer(scale):
+    exponent = decimal.Decimal(1).scaleb(-scale)
+    return lambda value: decimal.Decimal(str(value)).quantize(exponent)
+
+def temporal_normalizer(fsp):
+    unit = 10 ** (6 - fsp)
+
+    def normalize(value):
+        if isinstance(value, datetime.datetime):
+            return value.replace(microsecond=value.microsecond - value.microsecond % unit)
+        if isinstance(value, datetime.timedelta):
+            return value - datetime.timedelta(microseconds=value.microseconds % unit)
+        return value
+
+    return normalize
+
+def string_normalizer(case_insensitive, strip_trailing_spaces):
+    def normalize(value):
+        if isinstance(value, (bytes, bytearray)):
+            value = bytes(value).decode('utf-8', errors='replace')
+        if isinstance(value, (set, frozenset)):
+            value = ','.join(sorted(value))
+        value = str(value)
+        if strip_trailing_spaces:
+            value = value.rstrip(' ')
+        return value.casefold() if case_insensitive else value
+
+    return normalize
+
+def json_normalizer(value):
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value).decode('utf-8')
+    if isinstance(value, str):
+        value = json.loads(value)
+    return json.dumps(value, sort_keys=True)
+
+def binary_normalizer(pad_zeros):
+    def normalize(value):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        value = bytes(value)
+        return value.rstrip(b'\0') if pad_zeros else value
+
+    return normalize
+
+def build_normalizers(table_structure, collations=None):
+    collations = collations or {}
+    normalizers = {}
+    for column, column_type in table_structure.items():
+        column_type = column_type.lower()
+        collation = (collations.get(column) or '').lower()
+        arguments = parse_type_arguments(column_type)
+        base_type = column_type.split('(')[0].split()[0]
+        if base_type == 'float':
+            normalizers[column] = float_normalizer(6)
+        elif base_type in ('double', 'real'):
+            normalizers[column] = float_normalizer(15)
+        elif base_type in ('decimal', 'numeric'):
+            normalizers[column] = decimal_normalizer(arguments[1] if len(arguments) > 1 else 0)
+        elif base_type in ('datetime', 'timestamp', 'time'):
+            normalizers[column] = temporal_normalizer(arguments[0] if arguments else 0)
+        elif base_type == 'json':
+            normalizers[column] = json_normalizer
+        elif base_type in ('binary', 'varbinary') or base_type.endswith('blob'):
+            normalizers[column] = binary_normalizer(base_type == 'binary')
+        elif base_type in ('char', 'varchar', 'enum', 'set') or base_type.endswith('text'):
+            # CHAR values are returned without trailing spaces regardless of the collation
+            strip_trailing_spaces = base_type == 'char' or (base_type == 'varchar' and is_pad_space(collation))
+            normalizers[column] = string_normalizer(is_case_insensitive(collation), strip_trailing_spaces)
+    return normalizers
+
+def normalize_value(value, normalizer):
+    if value is None or normalizer is None:
+        return value
+    try:
+        return normalizer(value)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        return value
+
+def diff_row(src_row, dest_row, normalizers, spurious_counts=None):
+    changed_columns = set()
+    for column, src_value in src_row.items():
+        if column not in dest_row:
+            changed_columns.add(column)
+            continue
+        dest_value = dest_row[column]
+        if src_value == dest_value:
+            continue
+        normalizer = normalizers.get(column)
+        if normalizer and normalize_value(src_value, normalizer) == normalize_value(dest_value, normalizer):
+            if spurious_counts is not None:
+                spurious_counts[column] = spurious_counts.get(column, 0) + 1
+            continue
+        changed_columns.add(column)
+    return changed_columns
+
+def report_spurious_differences(table_name, spurious_counts):
+    if not spurious_counts:
+        return
+    summary = ', '.join(f"{column}: {count}" for column, count in sorted(spurious_counts.items()))
+    print(colored(f"Ignored representation-only differences in {table_name} ({summary})", 'cyan'))
+    logging.info(f"Ignored representation-only differences in {table_name} ({summary})")
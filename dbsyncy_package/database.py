@@ -2,9 +2,23 @@
 import mysql.connector
 from mysql.connector import Error, pooling
 from termcolor import colored
+from tqdm import tqdm
 import logging
+import os
+import re
+import tempfile
+import time
 import traceback
 import sys
+from .utils import batch, get_table_row_count, write_load_data_rows, load_data_file
+from .retry import run_with_retry, execute_with_retry
+from .compare import build_normalizers, diff_row, report_spurious_differences, is_case_insensitive
+
+LARGE_COLUMN_TYPES = ('blob', 'text', 'json')
+BINARY_COLUMN_TYPES = ('blob', 'binary')
+DEFERRED_DEFINITIONS = ('KEY ', 'UNIQUE KEY ', 'FULLTEXT KEY ', 'SPATIAL KEY ', 'CONSTRAINT ')
+DIGEST_FUNCTION = 'MD5'
+DIGEST_PREFIX = '__digest_'
 
 def log_error():
     exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -43,15 +57,18 @@ def create_connection(host_name, user_name, user_password, db_name, pool_name=No
         log_error()
         return None
 
-def create_new_connection(config):
+def create_new_connection(config, init_command=None):
     try:
+        options = {"init_command": init_command} if init_command else {}
         connection = mysql.connector.connect(
             host=config["host"],
+            port=int(config.get("port", 3306)),
             user=config["user"],
             passwd=config["password"],
             database=config["database"],
             client_flags=[mysql.connector.ClientFlag.LOCAL_FILES],
-            allow_local_infile=True
+            allow_local_infile=True,
+            **options
         )
         return connection
     except Error as e:
@@ -79,6 +96,24 @@ def get_primary_key(connection, table_name):
         log_error()
         return None
 
+def get_primary_key_columns(connection, table_name):
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT k.COLUMN_NAME
+            FROM information_schema.table_constraints t
+            JOIN information_schema.key_column_usage k
+            USING(constraint_name,table_schema,table_name)
+            WHERE t.constraint_type='PRIMARY KEY'
+                AND t.table_schema=DATABASE()
+                AND t.table_name=%s
+            ORDER BY k.ORDINAL_POSITION;
+        """, (table_name,))
+        return [row[0] for row in cursor.fetchall()]
+    except Error as e:
+        log_error()
+        return []
+
 def get_existing_columns(connection, table_name):
     try:
         cursor = connection.cursor()
@@ -100,6 +135,15 @@ def get_table_structure(connection, table_name):
         log_error()
         return None
 
+def get_column_collations(connection, table_name):
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SHOW FULL COLUMNS FROM {table_name}")
+        return {column[0]: column[2] for column in cursor.fetchall()}
+    except Error as e:
+        log_error()
+        return {}
+
 def get_table_collation(connection, table_name):
     try:
         cursor = connection.cursor()
@@ -110,19 +154,32 @@ def get_table_collation(connection, table_name):
         log_error()
         return None
 
-def check_and_create_table(src_connection, dest_connection, table_name):
+def table_exists(connection, table_name):
     try:
-        cursor = dest_connection.cursor()
+        cursor = connection.cursor()
         cursor.execute(f"SHOW TABLES LIKE '{table_name}'")
-        result = cursor.fetchone()
-        if not result:
-            print(colored(f"Table {table_name} does not exist on remote. Creating...", 'yellow'))
-            table_schema = get_table_schema(src_connection, table_name)
-            create_table(dest_connection, table_schema)
+        return cursor.fetchone() is not None
+    except Error as e:
+        log_error()
+        return False
+
+def check_and_create_table(src_connection, dest_connection, table_name, seed=False, batch_size=1000):
+    try:
+        if not table_exists(dest_connection, table_name):
+            if seed:
+                print(colored(f"Table {table_name} does not exist on remote. Seeding...", 'yellow'))
+                return seed_table(src_connection, dest_connection, table_name, batch_size)
+            else:
+                print(colored(f"Table {table_name} does not exist on remote. Creating...", 'yellow'))
+                table_schema = get_table_schema(src_connection, table_name)
+                create_table(dest_connection, table_schema)
+            return True
         else:
             sync_table_collation(src_connection, dest_connection, table_name)
+            return False
     except Error as e:
         log_error()
+        return False
 
 def get_table_schema(connection, table_name):
     try:
@@ -136,22 +193,137 @@ def get_table_schema(connection, table_name):
 
 def create_table(connection, table_schema):
     try:
-        cursor = connection.cursor()
-        cursor.execute(table_schema)
-        connection.commit()
+        execute_with_retry(connection, table_schema, "Error creating table")
         print(colored("Table created successfully", 'green'))
         logging.info("Table created successfully")
+        return True
     except Error as e:
         log_error()
+        return False
+
+def split_table_schema(table_schema):
+    # Separates secondary indexes and constraints from SHOW CREATE TABLE so they can be added after loading
+    lines = table_schema.split('\n')
+    closing = max(index for index, line in enumerate(lines) if line.startswith(')'))
+    definitions = [line.strip().rstrip(',') for line in lines[1:closing]]
+    if not any(definition.startswith('PRIMARY KEY') for definition in definitions):
+        return table_schema, []
+    # An AUTO_INCREMENT column must lead some index when the table is created, so such indexes stay
+    auto_increment = {definition.split('`')[1] for definition in definitions
+                      if definition.startswith('`') and 'AUTO_INCREMENT' in definition}
+
+    def is_deferred(definition):
+        if not definition.startswith(DEFERRED_DEFINITIONS):
+            return False
+        first_column = re.search(r'\(`([^`]+)`', definition)
+        return not (definition.startswith(('KEY ', 'UNIQUE KEY ')) and first_column and
+                    first_column.group(1) in auto_increment)
+
+    kept = [definition for definition in definitions if not is_deferred(definition)]
+    deferred = [definition for definition in definitions if is_deferred(definition)]
+    base_schema = '\n'.join([lines[0], ',\n'.join(f"  {definition}" for definition in kept)] + lines[closing:])
+    return base_schema, deferred
+
+def get_binary_columns(table_structure):
+    return {column for column, column_type in table_structure.items()
+            if any(binary_type in column_type.lower() for binary_type in BINARY_COLUMN_TYPES)}
+
+def stream_table_rows(connection, table_name, columns, batch_size=1000):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+def insert_rows_batched(src_connection, dest_connection, table_name, columns, batch_size=1000, progress=None):
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+    inserted = 0
+
+    def write_rows(connection, rows):
+        connection.cursor().executemany(sql, rows)
+        connection.commit()
+
+    for rows in stream_table_rows(src_connection, table_name, columns, batch_size):
+        run_with_retry(dest_connection, lambda connection: write_rows(connection, rows),
+                       f"Error inserting rows into {table_name}")
+        inserted += len(rows)
+        if progress:
+            progress.update(len(rows))
+    return inserted
+
+def bulk_load_table(src_connection, dest_connection, table_name, batch_size=1000):
+    table_structure = get_table_structure(src_connection, table_name)
+    columns = list(table_structure)
+    binary_columns = get_binary_columns(table_structure)
+    hex_flags = [column in binary_columns for column in columns]
+    total_rows = get_table_row_count(src_connection, table_name)
+    file_name = None
+    try:
+        with tqdm(total=total_rows, desc=f"Exporting {table_name}", unit="row") as progress:
+            with tempfile.NamedTemporaryFile(prefix=f"dbsyncy_{table_name}_", suffix='.tsv', delete=False) as file:
+                file_name = file.name
+                for rows in stream_table_rows(src_connection, table_name, columns, batch_size):
+                    write_load_data_rows(file, rows, hex_flags)
+                    progress.update(len(rows))
+        return run_with_retry(dest_connection,
+                              lambda connection: load_data_file(connection, table_name, file_name, columns, binary_columns),
+                              f"Error loading {table_name}")
+    except Error as e:
+        print(colored(f"LOAD DATA LOCAL INFILE failed for {table_name}, falling back to batched inserts: {e}", 'yellow'))
+        logging.warning(f"LOAD DATA LOCAL INFILE failed for {table_name}, falling back to batched inserts: {e}")
+        dest_connection.rollback()
+        execute_with_retry(dest_connection, f"TRUNCATE TABLE {table_name}", f"Error truncating {table_name}")
+        with tqdm(total=total_rows, desc=f"Inserting {table_name}", unit="row") as progress:
+            return insert_rows_batched(src_connection, dest_connection, table_name, columns, batch_size, progress)
+    finally:
+        if file_name and os.path.exists(file_name):
+            os.remove(file_name)
+
+def report_seed_stage(table_name, stage, started):
+    elapsed = time.time() - started
+    print(colored(f"Seeding {table_name}: {stage} in {elapsed:.2f}s", 'cyan'))
+    logging.info(f"Seeding {table_name}: {stage} in {elapsed:.2f}s")
+
+def seed_table(src_connection, dest_connection, table_name, batch_size=1000):
+    try:
+        seed_started = time.time()
+        base_schema, deferred_definitions = split_table_schema(get_table_schema(src_connection, table_name))
+
+        stage_started = time.time()
+        if not create_table(dest_connection, base_schema):
+            print(colored(f"Seeding {table_name} stopped, the table could not be created", 'red'))
+            logging.error(f"Seeding {table_name} stopped, the table could not be created")
+            return False
+        report_seed_stage(table_name, "created table without deferred indexes", stage_started)
+
+        stage_started = time.time()
+        loaded_rows = bulk_load_table(src_connection, dest_connection, table_name, batch_size)
+        report_seed_stage(table_name, f"loaded {loaded_rows} rows", stage_started)
+
+        if deferred_definitions:
+            stage_started = time.time()
+            execute_with_retry(dest_connection,
+                               f"ALTER TABLE {table_name} " + ', '.join(f"ADD {definition}" for definition in deferred_definitions),
+                               f"Error adding indexes to {table_name}")
+            report_seed_stage(table_name, f"added {len(deferred_definitions)} indexes and constraints", stage_started)
+
+        report_seed_stage(table_name, "completed", seed_started)
+        return True
+    except Error as e:
+        log_error()
+        return False
 
 def sync_table_collation(src_connection, dest_connection, table_name):
     try:
         src_collation = get_table_collation(src_connection, table_name)
         dest_collation = get_table_collation(dest_connection, table_name)
         if src_collation != dest_collation:
-            cursor = dest_connection.cursor()
-            cursor.execute(f"ALTER TABLE {table_name} CONVERT TO CHARACTER SET utf8mb4 COLLATE {src_collation}")
-            dest_connection.commit()
+            execute_with_retry(dest_connection,
+                               f"ALTER TABLE {table_name} CONVERT TO CHARACTER SET utf8mb4 COLLATE {src_collation}",
+                               f"Error updating collation of {table_name}")
             print(colored(f"Updated table collation for {table_name} to {src_collation}", 'green'))
             logging.info(f"Updated table collation for {table_name} to {src_collation}")
     except Error as e:
@@ -164,13 +336,13 @@ def compare_and_sync_structure(src_connection, dest_connection, table_name):
 
         for column, src_column_type in src_structure.items():
             if column not in dest_structure:
-                cursor = dest_connection.cursor()
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {src_column_type}")
+                execute_with_retry(dest_connection, f"ALTER TABLE {table_name} ADD COLUMN {column} {src_column_type}",
+                                   f"Error adding column {column} to {table_name}")
                 print(colored(f"Added column {column} to {table_name} in destination", 'green'))
                 logging.info(f"Added column {column} to {table_name} in destination")
             elif src_column_type != dest_structure[column]:
-                cursor = dest_connection.cursor()
-                cursor.execute(f"ALTER TABLE {table_name} MODIFY COLUMN {column} {src_column_type}")
+                execute_with_retry(dest_connection, f"ALTER TABLE {table_name} MODIFY COLUMN {column} {src_column_type}",
+                                   f"Error modifying column {column} in {table_name}")
                 print(colored(f"Modified column {column} in {table_name} in destination", 'green'))
                 logging.info(f"Modified column {column} in {table_name} in destination")
             else:
@@ -189,30 +361,147 @@ def sync_column_collation(src_connection, dest_connection, table_name, column):
         dest_collation = cursor.fetchone()[2]
 
         if src_collation != dest_collation:
-            cursor.execute(f"ALTER TABLE {table_name} MODIFY {column} COLLATE {src_collation}")
-            dest_connection.commit()
+            execute_with_retry(dest_connection, f"ALTER TABLE {table_name} MODIFY {column} COLLATE {src_collation}",
+                               f"Error updating collation of {column} in {table_name}")
             print(colored(f"Updated column collation for {column} in {table_name} to {src_collation}", 'green'))
             logging.info(f"Updated column collation for {column} in {table_name} to {src_collation}")
     except Error as e:
         log_error()
 
-def get_changed_rows(src_connection, dest_connection, table_name):
+def get_foreign_keys(connection):
     try:
-        primary_key = get_primary_key(src_connection, table_name)
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT CONSTRAINT_NAME, TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+            FROM information_schema.key_column_usage
+            WHERE table_schema=DATABASE()
+                AND referenced_table_schema=DATABASE()
+                AND referenced_table_name IS NOT NULL
+            ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION;
+        """)
+        foreign_keys = {}
+        for row in cursor.fetchall():
+            foreign_key = foreign_keys.setdefault((row['TABLE_NAME'], row['CONSTRAINT_NAME']), {
+                'name': row['CONSTRAINT_NAME'],
+                'table': row['TABLE_NAME'],
+                'columns': [],
+                'referenced_table': row['REFERENCED_TABLE_NAME'],
+                'referenced_columns': []
+            })
+            foreign_key['columns'].append(row['COLUMN_NAME'])
+            foreign_key['referenced_columns'].append(row['REFERENCED_COLUMN_NAME'])
+        return list(foreign_keys.values())
+    except Error as e:
+        log_error()
+        return []
 
-        cursor = src_connection.cursor(dictionary=True)
-        cursor.execute(f"SELECT * FROM {table_name}")
-        src_rows = cursor.fetchall()
+def verify_foreign_keys(connection, foreign_keys, tables=None):
+    try:
+        violations = {}
+        cursor = connection.cursor()
+        for foreign_key in foreign_keys:
+            if tables is not None and foreign_key['table'] not in tables:
+                continue
+            join = ' AND '.join(f"c.{column} = p.{referenced_column}" for column, referenced_column
+                                in zip(foreign_key['columns'], foreign_key['referenced_columns']))
+            not_null = ' AND '.join(f"c.{column} IS NOT NULL" for column in foreign_key['columns'])
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM {foreign_key['table']} c
+                LEFT JOIN {foreign_key['referenced_table']} p ON {join}
+                WHERE {not_null} AND p.{foreign_key['referenced_columns'][0]} IS NULL
+            """)
+            orphans = cursor.fetchone()[0]
+            if orphans:
+                violations[foreign_key['name']] = orphans
+                print(colored(f"Foreign key {foreign_key['name']} on {foreign_key['table']} has {orphans} orphaned rows", 'red'))
+                logging.error(f"Foreign key {foreign_key['name']} on {foreign_key['table']} has {orphans} orphaned rows")
+        if not violations:
+            print(colored("Foreign key verification passed", 'green'))
+            logging.info("Foreign key verification passed")
+        return violations
+    except Error as e:
+        log_error()
+        return None
+
+def get_large_columns(table_structure):
+    return [column for column, column_type in table_structure.items()
+            if any(large_type in column_type.lower() for large_type in LARGE_COLUMN_TYPES)]
+
+def build_digest_select(table_structure, large_columns, collations=None):
+    # Large columns are compared through a server-side digest instead of their full value
+    collations = collations or {}
 
-        cursor = dest_connection.cursor(dictionary=True)
-        cursor.execute(f"SELECT * FROM {table_name}")
-        dest_rows = cursor.fetchall()
+    def digest(column):
+        value = f"LOWER({column})" if is_case_insensitive((collations.get(column) or '').lower()) else column
+        return f"{DIGEST_FUNCTION}({value}) AS {DIGEST_PREFIX}{column}"
 
-        src_dict = {row[primary_key]: row for row in src_rows}
-        dest_dict = {row[primary_key]: row for row in dest_rows}
+    return ', '.join(digest(column) if column in large_columns else column for column in table_structure)
 
-        changed_rows = [src_dict[key] for key in src_dict if key not in dest_dict or src_dict[key] != dest_dict[key]]
-        deleted_rows = [dest_dict[key] for key in dest_dict if key not in src_dict]
+def strip_digests(row):
+    return {key: value for key, value in row.items() if not key.startswith(DIGEST_PREFIX)}
+
+def fetch_rows_by_key(connection, table_name, primary_key, keys, batch_size=500):
+    try:
+        rows = []
+        cursor = connection.cursor(dictionary=True)
+        for chunk in batch(keys, batch_size):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"SELECT * FROM {table_name} WHERE {primary_key} IN ({placeholders})", chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+    except Error as e:
+        log_error()
+        return []
+
+def get_diff_plan(connection, table_name):
+    table_structure = get_table_structure(connection, table_name)
+    collations = get_column_collations(connection, table_name)
+    large_columns = get_large_columns(table_structure)
+    return {
+        'primary_key': get_primary_key(connection, table_name),
+        'large_columns': large_columns,
+        'select_list': build_digest_select(table_structure, large_columns, collations),
+        'normalizers': build_normalizers(table_structure, collations)
+    }
+
+def read_diff_snapshot(connection, table_name, diff_plan):
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(f"SELECT {diff_plan['select_list']} FROM {table_name}")
+    return {row[diff_plan['primary_key']]: row for row in cursor.fetchall()}
+
+def diff_snapshots(table_name, src_dict, dest_dict, diff_plan):
+    spurious_counts = {}
+    changed_keys = []
+    # Columns that differ for rows already on the destination; new rows are written in full
+    changed_columns = {}
+    for key, src_row in src_dict.items():
+        if key not in dest_dict:
+            changed_keys.append(key)
+            continue
+        columns = diff_row(src_row, dest_dict[key], diff_plan['normalizers'], spurious_counts)
+        if columns:
+            changed_keys.append(key)
+            changed_columns[key] = {column[len(DIGEST_PREFIX):] if column.startswith(DIGEST_PREFIX) else column
+                                    for column in columns}
+    report_spurious_differences(table_name, spurious_counts)
+    deleted_rows = [strip_digests(dest_dict[key]) for key in dest_dict if key not in src_dict]
+    return changed_keys, deleted_rows, changed_columns
+
+def get_changed_rows(src_connection, dest_connection, table_name, batch_size=500, changed_columns=None):
+    try:
+        diff_plan = get_diff_plan(src_connection, table_name)
+        src_dict = read_diff_snapshot(src_connection, table_name, diff_plan)
+        dest_dict = read_diff_snapshot(dest_connection, table_name, diff_plan)
+        changed_keys, deleted_rows, row_changed_columns = diff_snapshots(table_name, src_dict, dest_dict, diff_plan)
+        if changed_columns is not None:
+            changed_columns.update(row_changed_columns)
+
+        if diff_plan['large_columns']:
+            changed_rows = fetch_rows_by_key(src_connection, table_name, diff_plan['primary_key'], changed_keys, batch_size)
+            logging.info(f"Compared {', '.join(diff_plan['large_columns'])} in {table_name} by {DIGEST_FUNCTION} digest, "
+                         f"fetched {len(changed_rows)} of {len(src_dict)} rows in full")
+        else:
+            changed_rows = [src_dict[key] for key in changed_keys]
 
         return changed_rows, deleted_rows
     except Error as e:
@@ -0,0 +1,92 @@
+import contextlib
+import logging
+import random
+import time
+from mysql.connector import Error
+from termcolor import colored
+
+LOCK_WAIT_TIMEOUT = 1205
+DEADLOCK = 1213
+SERVER_GONE_AWAY = 2006
+SERVER_LOST = 2013
+SERVER_LOST_EXTENDED = 2055
+
+CONTENTION_ERRORS = {LOCK_WAIT_TIMEOUT, DEADLOCK}
+CONNECTION_ERRORS = {SERVER_GONE_AWAY, SERVER_LOST, SERVER_LOST_EXTENDED}
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 0.1
+MAX_DELAY = 10.0
+
+def classify_error(error):
+    errno = getattr(error, 'errno', None)
+    if errno in CONTENTION_ERRORS:
+        return 'contention'
+    if errno in CONNECTION_ERRORS:
+        return 'connection'
+    return None
+
+def backoff_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    # Full jitter keeps writers that failed together from retrying in lockstep
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def reset_connection(connection, kind):
+    try:
+        if kind == 'connection':
+            connection.reconnect(attempts=3, delay=1)
+        else:
+            connection.rollback()
+    except Error as e:
+        logging.warning(f"Failed to reset connection after {kind} error: {e}")
+
+def run_with_retry(connection, operation, description, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                   max_delay=MAX_DELAY, lock=None):
+    # With a lock shared by other users of the connection, only the attempts hold it and the backoff does not
+    lock = lock or contextlib.nullcontext()
+    attempt = 0
+    while True:
+        with lock:
+            try:
+                return operation(connection)
+            except Error as e:
+                kind = classify_error(e)
+                attempt += 1
+                if kind is None or attempt >= max_attempts:
+                    raise
+                delay = backoff_delay(attempt, base_delay, max_delay)
+                logging.warning(f"{description}: {e}. Retrying {attempt}/{max_attempts - 1} in {delay:.2f}s")
+                reset_connection(connection, kind)
+        time.sleep(delay)
+
+def execute_with_retry(connection, sql, description, params=None, commit=True):
+    def operation(connection):
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        if commit:
+            connection.commit()
+        return cursor
+
+    return run_with_retry(connection, operation, description)
+
+def run_batch_with_retry(connection, rows, operation, description, lock=None):
+    # Runs operation(connection, rows) as one transaction; a batch rejected for its data is split in half
+    # so only the offending rows are dropped, a batch that ran out of retries on a transient error fails whole
+    try:
+        run_with_retry(connection, lambda connection: operation(connection, rows), description, lock=lock)
+        return 0
+    except Error as e:
+        kind = classify_error(e)
+        with lock or contextlib.nullcontext():
+            reset_connection(connection, kind or 'statement')
+        if kind is not None:
+            print(colored(f"{description}: {e}, giving up on {len(rows)} rows after {MAX_ATTEMPTS} attempts", 'red'))
+            logging.error(f"{description}: {e}, giving up on {len(rows)} rows after {MAX_ATTEMPTS} attempts")
+            return len(rows)
+        if len(rows) == 1:
+            print(colored(f"{description}: {e}", 'red'))
+            logging.error(f"{description}: {e}")
+            return 1
+        middle = len(rows) // 2
+        logging.warning(f"{description}: batch of {len(rows)} rows failed ({e}), splitting")
+        return (run_batch_with_retry(connection, rows[:middle], operation, description, lock) +
+                run_batch_with_retry(connection, rows[middle:], operation, description, lock))
@@ -0,0 +1,144 @@
+import logging
+import traceback
+import sys
+from termcolor import colored
+from .retry import execute_with_retry
+from .database import (create_new_connection, get_primary_key_columns, get_table_structure, table_exists,
+                       compare_and_sync_structure)
+
+DEFAULT_PORT = 3306
+
+def log_error():
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
+    error_message = f"{exc_type.__name__} - {exc_value}\n" + "".join(tb)
+    print(colored(error_message, 'red'))
+    logging.error(error_message)
+
+def same_server(src_config, dest_config):
+    # Both schemas must be reachable through one login for cross-schema statements
+    return (src_config["host"] == dest_config["host"] and
+            int(src_config.get("port", DEFAULT_PORT)) == int(dest_config.get("port", DEFAULT_PORT)) and
+            src_config["user"] == dest_config["user"] and
+            src_config["password"] == dest_config["password"] and
+            src_config["database"] != dest_config["database"])
+
+def row_hash(alias, columns):
+    # HEX keeps the separator and the NULL marker from colliding with column contents
+    values = ', '.join(f"IFNULL(HEX(CAST({alias}.{column} AS BINARY)), 'NULL')" for column in columns)
+    return f"MD5(CONCAT_WS('|', {values}))"
+
+def build_server_side_statements(src_schema, dest_schema, table_name, key_columns, columns):
+    src_table = f"{src_schema}.{table_name}"
+    dest_table = f"{dest_schema}.{table_name}"
+    value_columns = [column for column in columns if column not in key_columns]
+    # Primary key columns are NOT NULL, so a NULL first key column marks an unmatched outer join row
+    join = ' AND '.join(f"d.{column} = s.{column}" for column in key_columns)
+    key_column = key_columns[0]
+    statements = {
+        'insert': (
+            f"INSERT INTO {dest_table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(f's.{column}' for column in columns)} FROM {src_table} s "
+            f"LEFT JOIN {dest_table} d ON {join} WHERE d.{key_column} IS NULL",
+            f"SELECT COUNT(*) FROM {src_table} s "
+            f"LEFT JOIN {dest_table} d ON {join} WHERE d.{key_column} IS NULL"
+        ),
+        'delete': (
+            f"DELETE d FROM {dest_table} d "
+            f"LEFT JOIN {src_table} s ON {join} WHERE s.{key_column} IS NULL",
+            f"SELECT COUNT(*) FROM {dest_table} d "
+            f"LEFT JOIN {src_table} s ON {join} WHERE s.{key_column} IS NULL"
+        )
+    }
+    if value_columns:
+        changed = f"{row_hash('s', value_columns)} <> {row_hash('d', value_columns)}"
+        statements['update'] = (
+            f"UPDATE {dest_table} d JOIN {src_table} s ON {join} "
+            f"SET {', '.join(f'd.{column} = s.{column}' for column in value_columns)} WHERE {changed}",
+            f"SELECT COUNT(*) FROM {dest_table} d JOIN {src_table} s ON {join} WHERE {changed}"
+        )
+    return statements
+
+def run_server_side_statement(connection, table_name, operation, statements, dry_run):
+    statement, count_statement = statements
+    if dry_run:
+        cursor = connection.cursor()
+        cursor.execute(count_statement)
+        return cursor.fetchone()[0]
+    return execute_with_retry(connection, statement, f"Error applying {operation}s to {table_name}").rowcount
+
+def apply_server_side_deletes(dest_config, table_name, statements, dry_run, init_command=None):
+    dest_connection = create_new_connection(dest_config, init_command)
+    if not dest_connection:
+        print(colored(f"Failed to create connection for deleting rows from {table_name}", 'red'))
+        return
+    try:
+        count = run_server_side_statement(dest_connection, table_name, 'delete', statements, dry_run)
+        print(colored(f"Table {table_name} synchronized on server ({count} deletes)", 'green'))
+        logging.info(f"Table {table_name} synchronized on server ({count} deletes)")
+    except Exception as e:
+        log_error()
+    finally:
+        dest_connection.close()
+
+def sync_table_server_side(src_connection, dest_connection, src_config, dest_config, table_name, delete_missing,
+                           dry_run=False, seed_missing_tables=False, defer_deletes=None, init_command=None):
+    try:
+        if not table_exists(dest_connection, table_name):
+            if not seed_missing_tables or dry_run:
+                return
+            execute_with_retry(dest_connection,
+                               f"CREATE TABLE {dest_config['database']}.{table_name} LIKE {src_config['database']}.{table_name}",
+                               f"Error creating {table_name}")
+            print(colored(f"Created {table_name} in {dest_config['database']}", 'green'))
+            logging.info(f"Created {table_name} in {dest_config['database']}")
+        else:
+            compare_and_sync_structure(src_connection, dest_connection, table_name)
+
+        key_columns = get_primary_key_columns(src_connection, table_name)
+        if not key_columns:
+            # Without a key rows cannot be matched across the schemas
+            print(colored(f"Table {table_name} has no primary key, skipping server-side sync", 'yellow'))
+            logging.warning(f"Table {table_name} has no primary key, skipping server-side sync")
+            return
+        columns = list(get_table_structure(src_connection, table_name))
+        statements = build_server_side_statements(src_config['database'], dest_config['database'], table_name,
+                                                  key_columns, columns)
+        operations = ['update', 'insert']
+        if delete_missing and defer_deletes:
+            defer_deletes(table_name, lambda: apply_server_side_deletes(dest_config, table_name, statements['delete'],
+                                                                        dry_run, init_command))
+        elif delete_missing:
+            operations.append('delete')
+
+        counts = {}
+        for operation in operations:
+            if operation in statements:
+                counts[operation] = run_server_side_statement(dest_connection, table_name, operation,
+                                                              statements[operation], dry_run)
+        summary = ', '.join(f"{count} {operation}s" for operation, count in counts.items())
+        print(colored(f"Table {table_name} synchronized on server ({summary})", 'green'))
+        logging.info(f"Table {table_name} synchronized on server ({summary})")
+    except Exception as e:
+        log_error()
+
+def process_table_server_side(config, table, direction, delete_missing, dry_run, foreign_key_checks=True,
+                              seed_missing_tables=False, defer_deletes=None):
+    init_command = None if foreign_key_checks else "SET SESSION FOREIGN_KEY_CHECKS=0"
+    local_connection = create_new_connection(config["local"], init_command)
+    remote_connection = create_new_connection(config["remote"], init_command)
+    try:
+        if not local_connection or not remote_connection:
+            print(colored(f"Failed to create connection for table {table}", 'red'))
+            return
+
+        if direction in ['push', 'both'] and table_exists(local_connection, table):
+            sync_table_server_side(local_connection, remote_connection, config["local"], config["remote"], table,
+                                   delete_missing, dry_run, seed_missing_tables, defer_deletes, init_command)
+        if direction in ['pull', 'both'] and table_exists(remote_connection, table):
+            sync_table_server_side(remote_connection, local_connection, config["remote"], config["local"], table,
+                                   delete_missing, dry_run, seed_missing_tables, defer_deletes, init_command)
+    finally:
+        for connection in (local_connection, remote_connection):
+            if connection:
+                connection.close()
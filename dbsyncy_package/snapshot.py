@@ -0,0 +1,217 @@
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import traceback
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from termcolor import colored
+from tqdm import tqdm
+from .utils import write_load_data_rows, load_data_file, get_tables, get_table_row_count
+from .retry import run_with_retry
+from .changelog import CHANGELOG_TABLE
+from .database import (create_new_connection, get_primary_key_columns, get_table_structure, get_table_schema, get_binary_columns,
+                       table_exists, create_table)
+
+MANIFEST_FILE = 'manifest.json'
+SNAPSHOT_VERSION = 1
+
+def log_error():
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
+    error_message = f"{exc_type.__name__} - {exc_value}\n" + "".join(tb)
+    print(colored(error_message, 'red'))
+    logging.error(error_message)
+
+def export_chunk(connection, table_name, columns, key_columns, hex_flags, last_key, chunk_rows, path, fetch_size):
+    query = f"SELECT {', '.join(columns)} FROM {table_name}"
+    params = ()
+    if key_columns:
+        # Chunks continue after the full key of the previous chunk's last row, so rows sharing
+        # the leading key column across a chunk boundary are not skipped
+        if last_key is not None:
+            query += f" WHERE ({', '.join(key_columns)}) > ({', '.join(['%s'] * len(key_columns))})"
+            params = last_key
+        query += f" ORDER BY {', '.join(key_columns)} LIMIT {chunk_rows}"
+    key_indexes = [columns.index(column) for column in key_columns]
+
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    rows_written = 0
+    # The checksum covers the uncompressed contents so restores can be verified independently of compression
+    sha256 = hashlib.sha256()
+    with gzip.open(path, 'wb') as file:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            buffer = io.BytesIO()
+            write_load_data_rows(buffer, rows, hex_flags)
+            sha256.update(buffer.getvalue())
+            file.write(buffer.getvalue())
+            rows_written += len(rows)
+            if key_indexes:
+                last_key = tuple(rows[-1][index] for index in key_indexes)
+    return rows_written, last_key, sha256.hexdigest()
+
+def export_table_snapshot(config, table_name, directory, chunk_rows=100000, fetch_size=1000):
+    connection = create_new_connection(config)
+    if not connection:
+        raise ConnectionError(f"Failed to create connection for table {table_name}")
+    try:
+        # A consistent snapshot keeps the chunks of one table from seeing each other's concurrent changes
+        connection.start_transaction(consistent_snapshot=True, readonly=True)
+        table_structure = get_table_structure(connection, table_name)
+        columns = list(table_structure)
+        binary_columns = get_binary_columns(table_structure)
+        hex_flags = [column in binary_columns for column in columns]
+        key_columns = get_primary_key_columns(connection, table_name)
+
+        chunks = []
+        last_key = None
+        while True:
+            file_name = f"{table_name}.{len(chunks) + 1:05}.tsv.gz"
+            rows, last_key, checksum = export_chunk(connection, table_name, columns, key_columns, hex_flags, last_key,
+                                                    chunk_rows, os.path.join(directory, file_name), fetch_size)
+            if rows == 0 and chunks:
+                os.remove(os.path.join(directory, file_name))
+                break
+            chunks.append({'file': file_name, 'rows': rows, 'sha256': checksum})
+            if not key_columns or rows < chunk_rows:
+                break
+
+        connection.commit()
+        return {
+            'schema': get_table_schema(connection, table_name),
+            'columns': columns,
+            'binary_columns': sorted(binary_columns),
+            'primary_key': key_columns,
+            'row_count': sum(chunk['rows'] for chunk in chunks),
+            'chunks': chunks
+        }
+    finally:
+        connection.close()
+
+def export_snapshot(config, directory, tables=None, parallel=True, chunk_rows=100000, max_workers=None):
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if tables is None:
+            connection = create_new_connection(config)
+            if not connection:
+                print(colored("Failed to create connection for snapshot export", 'red'))
+                return None
+            tables = [table for table in get_tables(connection) if table != CHANGELOG_TABLE]
+            connection.close()
+
+        # Every table is read in its own consistent snapshot, so the dump is consistent per table only;
+        # rows written to other tables while the export runs may be in it or not
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'database': config["database"],
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'consistency': 'per-table',
+            'tables': {},
+            'failed_tables': []
+        }
+        with ThreadPoolExecutor(max_workers=max_workers if parallel else 1) as executor:
+            futures = {executor.submit(export_table_snapshot, config, table, directory, chunk_rows): table for table in tables}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Exporting Tables", unit="table"):
+                table = futures[future]
+                try:
+                    manifest['tables'][table] = future.result()
+                    logging.info(f"Exported {manifest['tables'][table]['row_count']} rows from {table}")
+                except Exception as exc:
+                    log_error()
+                    manifest['failed_tables'].append(table)
+
+        manifest['failed_tables'].sort()
+        with open(os.path.join(directory, MANIFEST_FILE), 'w') as file:
+            json.dump(manifest, file, indent=4)
+        if manifest['failed_tables']:
+            print(colored(f"Snapshot export to {directory} is incomplete, failed tables: {', '.join(manifest['failed_tables'])}", 'red'))
+            logging.error(f"Snapshot export to {directory} is incomplete, failed tables: {', '.join(manifest['failed_tables'])}")
+            return None
+        total_rows = sum(table['row_count'] for table in manifest['tables'].values())
+        print(colored(f"Exported {len(manifest['tables'])} tables ({total_rows} rows) to {directory}", 'green'))
+        logging.info(f"Exported {len(manifest['tables'])} tables ({total_rows} rows) to {directory}")
+        return manifest
+    except Exception as e:
+        log_error()
+        return None
+
+def restore_chunk(config, table_name, table_manifest, chunk, directory):
+    connection = create_new_connection(config, "SET SESSION FOREIGN_KEY_CHECKS=0, UNIQUE_CHECKS=0")
+    if not connection:
+        raise ConnectionError(f"Failed to create connection for table {table_name}")
+    file_name = None
+    try:
+        sha256 = hashlib.sha256()
+        with gzip.open(os.path.join(directory, chunk['file']), 'rb') as source:
+            with tempfile.NamedTemporaryFile(prefix=f"dbsyncy_{table_name}_", suffix='.tsv', delete=False) as target:
+                file_name = target.name
+                while True:
+                    data = source.read(1024 * 1024)
+                    if not data:
+                        break
+                    sha256.update(data)
+                    target.write(data)
+        if sha256.hexdigest() != chunk['sha256']:
+            raise ValueError(f"Checksum mismatch for {chunk['file']}")
+
+        return run_with_retry(connection,
+                              lambda connection: load_data_file(connection, table_name, file_name, table_manifest['columns'],
+                                                                set(table_manifest['binary_columns'])),
+                              f"Error loading {chunk['file']}")
+    finally:
+        if file_name and os.path.exists(file_name):
+            os.remove(file_name)
+        connection.close()
+
+def import_snapshot(config, directory, tables=None, parallel=True, max_workers=None):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        if manifest.get('failed_tables'):
+            print(colored(f"Snapshot in {directory} is incomplete, missing tables: {', '.join(manifest['failed_tables'])}", 'yellow'))
+            logging.warning(f"Snapshot in {directory} is incomplete, missing tables: {', '.join(manifest['failed_tables'])}")
+        tables = [table for table in manifest['tables'] if tables is None or table in tables]
+
+        connection = create_new_connection(config, "SET SESSION FOREIGN_KEY_CHECKS=0")
+        if not connection:
+            print(colored("Failed to create connection for snapshot import", 'red'))
+            return False
+        for table in tables:
+            if not table_exists(connection, table):
+                create_table(connection, manifest['tables'][table]['schema'])
+
+        tasks = [(table, chunk) for table in tables for chunk in manifest['tables'][table]['chunks']]
+        with ThreadPoolExecutor(max_workers=max_workers if parallel else 1) as executor:
+            futures = [executor.submit(restore_chunk, config, table, manifest['tables'][table], chunk, directory)
+                       for table, chunk in tasks]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Restoring Chunks", unit="chunk"):
+                try:
+                    future.result()
+                except Exception as exc:
+                    log_error()
+
+        mismatched = 0
+        for table in tables:
+            expected = manifest['tables'][table]['row_count']
+            actual = get_table_row_count(connection, table)
+            if actual != expected:
+                mismatched += 1
+                print(colored(f"Row count mismatch for {table}: expected {expected}, found {actual}", 'red'))
+                logging.error(f"Row count mismatch for {table}: expected {expected}, found {actual}")
+        connection.close()
+
+        if not mismatched:
+            print(colored(f"Restored {len(tables)} tables from {directory}", 'green'))
+            logging.info(f"Restored {len(tables)} tables from {directory}")
+        return not mismatched
+    except Exception as e:
+        log_error()
+        return False
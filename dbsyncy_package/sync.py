@@ -1,12 +1,16 @@
 # dbsyncy_package/sync.py
 import logging
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from termcolor import colored
+from tqdm import tqdm
 import traceback
 import sys
-from .utils import batch, prepare_row
-from .database import get_changed_rows, compare_and_sync_structure, create_new_connection, get_existing_columns, get_table_structure
+from .utils import batch, prepare_row, get_tables
+from .retry import run_batch_with_retry
+from .server_side import same_server, process_table_server_side
+from .changelog import CHANGELOG_TABLE, changelog_primary_key, changelog_triggers_installed, install_changelog_triggers, read_changelog, purge_changelog
+from .database import get_changed_rows, get_primary_key, get_primary_key_columns, fetch_rows_by_key, get_diff_plan, read_diff_snapshot, diff_snapshots, get_table_schema, create_table, compare_and_sync_structure, create_new_connection, get_existing_columns, get_table_structure, get_foreign_keys, verify_foreign_keys, table_exists, seed_table
 
 def log_error():
     exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -16,94 +20,228 @@ def log_error():
     logging.error(error_message)
 
 def sync_rows(src_connection, dest_connection, table_name, changed_rows, deleted_rows, delete_missing, batch_size=100,
-              dry_run=False, parallel=False):
+              dry_run=False, parallel=False, changed_columns=None):
     try:
         existing_columns = get_existing_columns(dest_connection, table_name)
         table_structure = get_table_structure(dest_connection, table_name)
-        cursor = dest_connection.cursor()
+        primary_key = get_primary_key(dest_connection, table_name)
+        key_columns = get_primary_key_columns(dest_connection, table_name) or [primary_key]
+        # Narrow updates are keyed on a single column, rows of composite-key tables are always upserted
+        if len(key_columns) > 1:
+            changed_columns = None
+        # Batches share the destination connection; a batch holds it only while writing, not while backing off
+        connection_lock = threading.Lock()
+        failed_rows = 0
+        delta_stats = {'rows': 0, 'bytes_saved': 0}
+
+        def write_upserts(connection, rows):
+            columns = ', '.join(rows[0].keys())
+            values = ', '.join(f"({', '.join(f'{value}' for value in row.values())})" for row in rows)
+            update_clause = ', '.join([f"{key}=VALUES({key})" for key in rows[0].keys()])
+            cursor = connection.cursor()
+            cursor.execute(f"INSERT INTO {table_name} ({columns}) VALUES {values} ON DUPLICATE KEY UPDATE {update_clause}")
+            connection.commit()
+
+        def write_updates(connection, rows, columns):
+            # Only the changed columns are written, one CASE per column keyed on the primary key
+            keys = ', '.join(f"{row[primary_key]}" for row in rows)
+            assignments = ', '.join(
+                f"{column} = CASE {primary_key} " + ' '.join(f"WHEN {row[primary_key]} THEN {row[column]}" for row in rows) + " END"
+                for column in columns)
+            cursor = connection.cursor()
+            cursor.execute(f"UPDATE {table_name} SET {assignments} WHERE {primary_key} IN ({keys})")
+            connection.commit()
+
+        def write_deletes(connection, rows):
+            keys = [row[primary_key] for row in rows]
+            placeholders = ', '.join(['%s'] * len(keys))
+            cursor = connection.cursor()
+            cursor.execute(f"DELETE FROM {table_name} WHERE {primary_key} IN ({placeholders})", keys)
+            connection.commit()
 
         def process_chunk(chunk):
-            values_list = []
+            # Rows are written as one multi-row upsert per column layout, or as one narrow UPDATE
+            # per set of changed columns when the diff reported which columns differ
+            groups = {}
+            bytes_saved = 0
             for row in chunk:
-                row = prepare_row(row, existing_columns, table_structure)
-                columns = ', '.join(row.keys())
-                values = ', '.join([f"{value}" for value in row.values()])
-                update_clause = ', '.join([f"{key}=VALUES({key})" for key in row.keys()])
-                sql = f"INSERT INTO {table_name} ({columns}) VALUES ({values}) ON DUPLICATE KEY UPDATE {update_clause}"
-                retry_count = 0
-                while retry_count < 3:
-                    try:
-                        if not dry_run:
-                            cursor.execute(sql)
-                            logging.info(f"Inserted/Updated row in table {table_name}: {values}")
-                        break
-                    except Error as e:
-                        if 'Lock wait timeout exceeded' in str(e):
-                            retry_count += 1
-                            logging.warning(f"Lock wait timeout exceeded. Retrying {retry_count}/3")
-                            time.sleep(1)
-                        else:
-                            print(colored(f"Error synchronizing table {table_name}: {e}", 'red'))
-                            logging.error(f"Error synchronizing table {table_name}: {e}")
-                            break
-
-        if parallel:
-            with ThreadPoolExecutor() as executor:
-                futures = [executor.submit(process_chunk, chunk) for chunk in batch(changed_rows, batch_size)]
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as exc:
-                        log_error()
-        else:
-            for chunk in batch(changed_rows, batch_size):
-                process_chunk(chunk)
+                prepared_row = prepare_row(row, existing_columns, table_structure)
+                columns = changed_columns.get(row[primary_key]) if changed_columns else None
+                columns = tuple(sorted(column for column in columns or () if column in prepared_row and column not in key_columns))
+                if columns:
+                    groups.setdefault(('update', columns), []).append(prepared_row)
+                    bytes_saved += sum(len(f"{value}") for column, value in prepared_row.items()
+                                       if column not in columns and column not in key_columns)
+                else:
+                    groups.setdefault(('upsert', tuple(prepared_row.keys())), []).append(prepared_row)
+            failed = 0
+            for (mode, columns), rows in groups.items():
+                group_failed = 0
+                if not dry_run:
+                    if mode == 'update':
+                        operation = lambda connection, rows, columns=columns: write_updates(connection, rows, columns)
+                    else:
+                        operation = write_upserts
+                    group_failed = run_batch_with_retry(dest_connection, rows, operation,
+                                                        f"Error synchronizing table {table_name}", connection_lock)
+                failed += group_failed
+                if dry_run and mode == 'update':
+                    logging.info(f"Dry run: would update {', '.join(columns)} in {len(rows)} rows in table {table_name}")
+                elif dry_run:
+                    logging.info(f"Dry run: would insert/update {len(rows)} rows in table {table_name}")
+                elif mode == 'update':
+                    logging.info(f"Updated {', '.join(columns)} in {len(rows) - group_failed} rows in table {table_name}")
+                else:
+                    logging.info(f"Inserted/Updated {len(rows) - group_failed} rows in table {table_name}")
+            with connection_lock:
+                delta_stats['rows'] += sum(len(rows) for (mode, _), rows in groups.items() if mode == 'update')
+                delta_stats['bytes_saved'] += bytes_saved
+            return failed
 
-        if delete_missing:
-            def process_delete(row):
-                conditions = ' AND '.join([f"{key}='{value}'" for key, value in row.items() if value != 'NULL'])
-                sql = f"DELETE FROM {table_name} WHERE {conditions}"
-                retry_count = 0
-                while retry_count < 3:
-                    try:
-                        if not dry_run:
-                            cursor.execute(sql)
-                            logging.info(f"Deleted row from {table_name}: {conditions}")
-                        break
-                    except Error as e:
-                        if 'Lock wait timeout exceeded' in str(e):
-                            retry_count += 1
-                            logging.warning(f"Lock wait timeout exceeded. Retrying {retry_count}/3")
-                            time.sleep(1)
-                        else:
-                            print(colored(f"Error deleting row from table {table_name}: {e}", 'red'))
-                            logging.error(f"Error deleting row from table {table_name}: {e}")
-                            break
+        def process_delete(chunk):
+            if dry_run:
+                logging.info(f"Dry run: would delete {len(chunk)} rows from {table_name}")
+                return 0
+            failed = run_batch_with_retry(dest_connection, list(chunk), write_deletes,
+                                          f"Error deleting rows from table {table_name}", connection_lock)
+            logging.info(f"Deleted {len(chunk) - failed} rows from {table_name}")
+            return failed
 
+        def run_chunks(process, rows):
+            failed = 0
             if parallel:
                 with ThreadPoolExecutor() as executor:
-                    futures = [executor.submit(process_delete, row) for row in batch(deleted_rows, batch_size)]
+                    futures = [executor.submit(process, chunk) for chunk in batch(rows, batch_size)]
                     for future in as_completed(futures):
                         try:
-                            future.result()
+                            failed += future.result()
                         except Exception as exc:
                             log_error()
             else:
-                for row in batch(deleted_rows, batch_size):
-                    process_delete(row)
+                for chunk in batch(rows, batch_size):
+                    failed += process(chunk)
+            return failed
 
-        if not dry_run:
-            dest_connection.commit()
-        print(colored(f"Table {table_name} synchronized", 'green'))
-        logging.info(f"Table {table_name} synchronized")
+        failed_rows += run_chunks(process_chunk, changed_rows)
+        if delete_missing:
+            failed_rows += run_chunks(process_delete, deleted_rows)
+
+        if delta_stats['rows']:
+            delta_summary = (f"Delta updates in {table_name}: {delta_stats['rows']} rows written column-wise, "
+                             f"~{delta_stats['bytes_saved']} bytes of unchanged column values skipped")
+            print(colored(delta_summary, 'cyan'))
+            logging.info(delta_summary)
+
+        if failed_rows:
+            print(colored(f"Table {table_name} synchronized with {failed_rows} failed rows", 'yellow'))
+            logging.warning(f"Table {table_name} synchronized with {failed_rows} failed rows")
+        else:
+            print(colored(f"Table {table_name} synchronized", 'green'))
+            logging.info(f"Table {table_name} synchronized")
+        return failed_rows
     except Exception as e:
         log_error()
+        return None
+
+def drain_changelog(src_connection, dest_connection, table_name, delete_missing, batch_size=100, dry_run=False,
+                    parallel=False):
+    try:
+        primary_key = get_primary_key(src_connection, table_name)
+        last_id = 0
+        drained_keys = 0
+        while True:
+            entries = read_changelog(src_connection, table_name, last_id, batch_size)
+            if not entries:
+                break
+            last_id = entries[-1][0]
+            keys = list(dict.fromkeys(pk_value for _, pk_value in entries))
+            changed_rows = fetch_rows_by_key(src_connection, table_name, primary_key, keys, batch_size)
+            # Keys that no longer exist on the source were deleted after being logged
+            found_keys = {str(row[primary_key]) for row in changed_rows}
+            deleted_rows = [{primary_key: key} for key in keys if key not in found_keys]
+            failed_rows = sync_rows(src_connection, dest_connection, table_name, changed_rows, deleted_rows,
+                                    delete_missing, batch_size, dry_run, parallel)
+            if failed_rows != 0:
+                print(colored(f"Stopped draining changelog for {table_name}, undrained entries are kept", 'yellow'))
+                logging.warning(f"Stopped draining changelog for {table_name}, undrained entries are kept")
+                break
+            if not dry_run:
+                purge_changelog(src_connection, table_name, [entry_id for entry_id, _ in entries])
+            drained_keys += len(keys)
+        print(colored(f"Drained {drained_keys} changed keys from changelog for {table_name}", 'green'))
+        logging.info(f"Drained {drained_keys} changed keys from changelog for {table_name}")
+    except Exception as e:
+        log_error()
+
+def build_dependency_graph(tables, foreign_keys):
+    parents = {table: set() for table in tables}
+    for foreign_key in foreign_keys:
+        child, parent = foreign_key['table'], foreign_key['referenced_table']
+        if child in parents and parent in parents and child != parent:
+            parents[child].add(parent)
+    return parents
+
+def plan_sync_order(parents):
+    waiting = {table: set(deps) for table, deps in parents.items()}
+    order = []
+    while waiting:
+        ready = sorted(table for table, deps in waiting.items() if not deps)
+        if not ready:
+            # Break a foreign key cycle at the table with the fewest unresolved parents
+            ready = [min(sorted(waiting), key=lambda table: len(waiting[table]))]
+            logging.warning(f"Foreign key cycle detected, syncing {ready[0]} before its parents {sorted(waiting[ready[0]])}")
+        order.extend(ready)
+        for table in ready:
+            del waiting[table]
+        for deps in waiting.values():
+            deps.difference_update(ready)
+    return order
+
+def reverse_dependency_graph(parents):
+    children = {table: set() for table in parents}
+    for table, deps in parents.items():
+        for parent in deps:
+            children[parent].add(table)
+    return children
 
-def sync_tables(config, direction='both', batch_size=100, delete_missing=True, dry_run=False, parallel=False):
+def run_dependency_schedule(parents, run_table):
+    waiting = {table: set(deps) for table, deps in parents.items()}
+    children = reverse_dependency_graph(parents)
+
+    with ThreadPoolExecutor() as executor:
+        running = {}
+
+        def submit_ready():
+            ready = sorted(table for table, deps in waiting.items() if not deps)
+            if not ready and not running and waiting:
+                ready = [min(sorted(waiting), key=lambda table: len(waiting[table]))]
+                logging.warning(f"Foreign key cycle detected, syncing {ready[0]} before its parents {sorted(waiting[ready[0]])}")
+            for table in ready:
+                del waiting[table]
+                running[executor.submit(run_table, table)] = table
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                table = running.pop(future)
+                try:
+                    future.result()
+                except Exception as exc:
+                    log_error()
+                for child in children[table]:
+                    if child in waiting:
+                        waiting[child].discard(table)
+            submit_ready()
+
+def sync_tables(config, direction='both', batch_size=100, delete_missing=True, dry_run=False, parallel=False,
+                foreign_key_checks=True, seed_missing_tables=False, changelog_tables=()):
     global src_connection, dest_connection
     try:
+        # A list of destinations fans a push out to several replicas from a single source read
+        destinations = config.get("destinations") if direction == 'push' else None
         src_config = config["local"] if direction == 'push' else config["remote"]
-        dest_config = config["remote"] if direction == 'push' else config["local"]
+        dest_config = destinations[0] if destinations else config["remote"] if direction == 'push' else config["local"]
 
         src_connection = create_new_connection(src_config)
         dest_connection = create_new_connection(dest_config)
@@ -112,59 +250,342 @@ def sync_tables(config, direction='both', batch_size=100, delete_missing=True, d
             print(colored("Failed to create initial connections", 'red'))
             return
 
+        if destinations and changelog_tables:
+            # A drained changelog entry is purged once, so it cannot be replayed to several replicas
+            print(colored("Changelog capture is not supported with multiple destinations, tables are compared in full", 'yellow'))
+            logging.warning("Changelog capture is not supported with multiple destinations, tables are compared in full")
+
         src_tables = get_tables(src_connection)
         dest_tables = get_tables(dest_connection)
+        foreign_keys = get_foreign_keys(src_connection)
         src_connection.close()
         dest_connection.close()
 
+        src_tables = [table for table in src_tables if table != CHANGELOG_TABLE]
+        dest_tables = [table for table in dest_tables if table != CHANGELOG_TABLE]
         common_tables = list(set(src_tables) & set(dest_tables))
-
-        if parallel:
-            with ThreadPoolExecutor() as executor:
-                futures = [executor.submit(process_table, config, table, direction, batch_size,
-                                           delete_missing, dry_run, parallel) for table in common_tables]
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as exc:
-                        log_error()
+        # Tables missing on one side are created and bulk-loaded by process_table in seed mode
+        if destinations:
+            sync_tables_list = src_tables
+        elif seed_missing_tables and not dry_run:
+            sync_tables_list = list(set(src_tables) | set(dest_tables))
         else:
-            for table in tqdm(common_tables, desc="Syncing Tables", unit="table"):
-                process_table(config, table, direction, batch_size, delete_missing, dry_run, parallel)
+            sync_tables_list = common_tables
+        # With foreign key checks disabled every table can be loaded independently
+        parents = build_dependency_graph(sync_tables_list, foreign_keys if foreign_key_checks else [])
+
+        # Schemas on one server are diffed and applied with set-based SQL without moving rows through the client
+        server_side = not destinations and same_server(config["local"], config["remote"])
+        if server_side:
+            print(colored("Local and remote share a server, syncing with server-side statements", 'cyan'))
+            logging.info("Local and remote share a server, syncing with server-side statements")
+
+        # With foreign key checks on, deletes are held back until every table has its upserts and are then
+        # applied children first, so parent rows are never deleted while child rows still reference them
+        deferred_deletes = {}
+        deferred_lock = threading.Lock()
+
+        def defer_deletes(table, apply):
+            with deferred_lock:
+                deferred_deletes.setdefault(table, []).append(apply)
+
+        defer = defer_deletes if delete_missing and foreign_key_checks else None
+
+        def run_table(table, pass_direction):
+            if server_side:
+                process_table_server_side(config, table, pass_direction, delete_missing, dry_run, foreign_key_checks,
+                                          seed_missing_tables, defer)
+            elif destinations:
+                fan_out_table(src_config, destinations, table, batch_size, delete_missing, dry_run, parallel,
+                              foreign_key_checks, defer, seed_missing_tables)
+            else:
+                process_table(config, table, pass_direction, batch_size, delete_missing, dry_run, parallel,
+                              foreign_key_checks, seed_missing_tables, changelog_tables, defer)
+
+        def run_deletes(table):
+            for apply in deferred_deletes.get(table, []):
+                apply()
+
+        # A two-way sync with held back deletes pushes every table and applies the push deletes before the
+        # pull pass diffs, otherwise the pull would copy back the rows the push is about to delete
+        passes = ['push', 'pull'] if direction == 'both' and defer else [direction]
+        for pass_direction in passes:
+            deferred_deletes.clear()
+            if parallel:
+                run_dependency_schedule(parents, lambda table: run_table(table, pass_direction))
+                if deferred_deletes:
+                    run_dependency_schedule(reverse_dependency_graph(parents), run_deletes)
+            else:
+                order = plan_sync_order(parents)
+                for table in tqdm(order, desc="Syncing Tables", unit="table"):
+                    run_table(table, pass_direction)
+                for table in reversed(order):
+                    run_deletes(table)
+
+        if not foreign_key_checks and not dry_run:
+            if destinations:
+                verify_configs = destinations
+            elif direction == 'both':
+                verify_configs = [config["remote"], config["local"]]
+            else:
+                verify_configs = [dest_config]
+            for verify_config in verify_configs:
+                verify_connection = create_new_connection(verify_config)
+                if verify_connection:
+                    verify_foreign_keys(verify_connection, foreign_keys, set(sync_tables_list))
+                    verify_connection.close()
     except Exception as e:
         log_error()
 
-def process_table(config, table, direction, batch_size, delete_missing, dry_run, parallel):
+def apply_deletes(dest_config, table, deleted_rows, batch_size, dry_run, parallel, init_command=None):
+    dest_connection = create_new_connection(dest_config, init_command)
+    if not dest_connection:
+        print(colored(f"Failed to create connection for deleting rows from {table}", 'red'))
+        return
     try:
-        src_config = config["local"] if direction in ['push', 'both'] else config["remote"]
-        dest_config = config["remote"] if direction in ['push', 'both'] else config["local"]
+        sync_rows(None, dest_connection, table, [], deleted_rows, True, batch_size, dry_run, parallel)
+    finally:
+        dest_connection.close()
 
-        src_connection = create_new_connection(src_config)
-        dest_connection = create_new_connection(dest_config)
+def write_changes(src_connection, dest_connection, dest_config, table, changed_rows, deleted_rows, delete_missing,
+                  batch_size, dry_run, parallel, changed_columns=None, init_command=None, defer_deletes=None):
+    if defer_deletes is None:
+        return sync_rows(src_connection, dest_connection, table, changed_rows, deleted_rows, delete_missing, batch_size,
+                         dry_run, parallel, changed_columns)
+    if delete_missing and deleted_rows:
+        defer_deletes(table, lambda: apply_deletes(dest_config, table, deleted_rows, batch_size, dry_run, parallel,
+                                                   init_command))
+    return sync_rows(src_connection, dest_connection, table, changed_rows, [], False, batch_size, dry_run, parallel,
+                     changed_columns)
+
+def process_table(config, table, direction, batch_size, delete_missing, dry_run, parallel, foreign_key_checks=True,
+                  seed_missing_tables=False, changelog_tables=(), defer_deletes=None):
+    try:
+        # The push and pull branches pick their own direction, so local and remote keep their roles here
+        src_config = config["local"]
+        dest_config = config["remote"]
+
+        # Passed as init_command so the setting survives transparent reconnects
+        init_command = None if foreign_key_checks else "SET SESSION FOREIGN_KEY_CHECKS=0"
+        src_connection = create_new_connection(src_config, init_command)
+        dest_connection = create_new_connection(dest_config, init_command)
 
         if not src_connection or not dest_connection:
             print(colored(f"Failed to create connection for table {table}", 'red'))
             return
 
-        if direction in ['push', 'both']:
-            if has_table_changed(src_connection, dest_connection, table):
+        if direction in ['push', 'both'] and table_exists(src_connection, table):
+            use_changelog = False
+            if table in changelog_tables and changelog_primary_key(src_connection, table):
+                use_changelog = changelog_triggers_installed(src_connection, table)
+                if not use_changelog and not dry_run:
+                    # Changes are captured from here on, this run still does the full comparison
+                    install_changelog_triggers(src_connection, table)
+            seeded = (seed_missing_tables and not dry_run and not table_exists(dest_connection, table) and
+                      seed_table(src_connection, dest_connection, table, batch_size))
+            if not seeded and use_changelog:
+                compare_and_sync_structure(src_connection, dest_connection, table)
+                drain_changelog(src_connection, dest_connection, table, delete_missing, batch_size, dry_run, parallel)
+            elif not seeded and has_table_changed(src_connection, dest_connection, table):
                 compare_and_sync_structure(src_connection, dest_connection, table)
-                changed_rows, deleted_rows = get_changed_rows(src_connection, dest_connection, table)
-                sync_rows(src_connection, dest_connection, table, changed_rows, deleted_rows, delete_missing, batch_size,
-                          dry_run, parallel)
+                changed_columns = {}
+                changed_rows, deleted_rows = get_changed_rows(src_connection, dest_connection, table,
+                                                              changed_columns=changed_columns)
+                write_changes(src_connection, dest_connection, dest_config, table, changed_rows, deleted_rows,
+                              delete_missing, batch_size, dry_run, parallel, changed_columns, init_command, defer_deletes)
 
-        if direction in ['pull', 'both']:
-            if has_table_changed(dest_connection, src_connection, table):
+        if direction in ['pull', 'both'] and table_exists(dest_connection, table):
+            seeded = (seed_missing_tables and not dry_run and not table_exists(src_connection, table) and
+                      seed_table(dest_connection, src_connection, table, batch_size))
+            if not seeded and has_table_changed(dest_connection, src_connection, table):
                 compare_and_sync_structure(dest_connection, src_connection, table)
-                changed_rows, deleted_rows = get_changed_rows(dest_connection, src_connection, table)
-                sync_rows(dest_connection, src_connection, table, changed_rows, deleted_rows, delete_missing, batch_size,
-                          dry_run, parallel)
+                changed_columns = {}
+                changed_rows, deleted_rows = get_changed_rows(dest_connection, src_connection, table,
+                                                              changed_columns=changed_columns)
+                write_changes(dest_connection, src_connection, src_config, table, changed_rows, deleted_rows,
+                              delete_missing, batch_size, dry_run, parallel, changed_columns, init_command, defer_deletes)
 
         src_connection.close()
         dest_connection.close()
     except Exception as e:
         log_error()
 
+def destination_name(dest_config):
+    return dest_config.get("name", f"{dest_config['host']}/{dest_config['database']}")
+
+def make_payload_fetcher(table_name, diff_plan, src_dict, batch_size, max_cached_rows=None):
+    # Destinations read full rows through a shared cache: a row is kept only while another registered
+    # destination still needs it and the cache is capped, so an evicted row is simply read again
+    if not diff_plan['large_columns']:
+        return (lambda keys: None), (lambda connection, keys: [src_dict[key] for key in keys])
+
+    primary_key = diff_plan['primary_key']
+    max_cached_rows = max_cached_rows or batch_size * 100
+    lock = threading.Lock()
+    cache = {}
+    demand = {}
+    in_flight = {}
+
+    def register(keys):
+        with lock:
+            for key in keys:
+                demand[key] = demand.get(key, 0) + 1
+
+    def fetch(connection, keys):
+        rows = {}
+        with lock:
+            for key in keys:
+                if key in cache:
+                    rows[key] = cache[key]
+            pending = {key: in_flight[key] for key in keys if key not in rows and key in in_flight}
+            missing = [key for key in keys if key not in rows and key not in pending]
+            fetched = threading.Event()
+            for key in missing:
+                in_flight[key] = fetched
+
+        # The source is read outside the lock on the caller's own connection
+        found = {}
+        try:
+            if missing:
+                found = {row[primary_key]: row for row in
+                         fetch_rows_by_key(connection, table_name, primary_key, missing, batch_size)}
+        finally:
+            with lock:
+                for key in missing:
+                    in_flight.pop(key)
+                    rows[key] = found.get(key)
+                    if demand.get(key, 0) > 1:
+                        # Keys no longer on the source are cached as None so other destinations skip them
+                        cache[key] = found.get(key)
+                while len(cache) > max_cached_rows:
+                    cache.pop(next(iter(cache)))
+                fetched.set()
+
+        for event in set(pending.values()):
+            event.wait()
+        with lock:
+            evicted = [key for key in pending if key not in cache]
+            for key in pending:
+                if key in cache:
+                    rows[key] = cache[key]
+        if evicted:
+            for row in fetch_rows_by_key(connection, table_name, primary_key, evicted, batch_size):
+                rows[row[primary_key]] = row
+
+        with lock:
+            for key in keys:
+                demand[key] = demand.get(key, 1) - 1
+                if demand[key] <= 0:
+                    demand.pop(key)
+                    cache.pop(key, None)
+        return [rows[key] for key in keys if rows.get(key) is not None]
+
+    return register, fetch
+
+def sync_destination(src_config, dest_config, table, diff_plan, src_dict, table_schema, register, fetch, batch_size,
+                     delete_missing, dry_run, parallel, init_command, defer_deletes=None, seed_missing_tables=False):
+    name = destination_name(dest_config)
+    src_connection = create_new_connection(src_config, init_command)
+    dest_connection = create_new_connection(dest_config, init_command)
+    try:
+        if not src_connection or not dest_connection:
+            print(colored(f"Failed to create connection for table {table} on {name}", 'red'))
+            logging.error(f"Failed to create connection for table {table} on {name}")
+            return False
+        if not table_exists(dest_connection, table):
+            if dry_run:
+                return True
+            if seed_missing_tables:
+                return seed_table(src_connection, dest_connection, table, batch_size)
+            create_table(dest_connection, table_schema)
+        else:
+            compare_and_sync_structure(src_connection, dest_connection, table)
+
+        dest_dict = read_diff_snapshot(dest_connection, table, diff_plan)
+        changed_keys, deleted_rows, changed_columns = diff_snapshots(table, src_dict, dest_dict, diff_plan)
+        register(changed_keys)
+        # Each destination diffs, fetches and writes at its own pace, so a slow replica only delays itself
+        failed_rows = 0
+        for keys in batch(changed_keys, batch_size * 10):
+            failed = sync_rows(src_connection, dest_connection, table, fetch(src_connection, list(keys)), [], False,
+                               batch_size, dry_run, parallel, changed_columns)
+            failed_rows += 1 if failed is None else failed
+        if delete_missing and deleted_rows:
+            if defer_deletes:
+                defer_deletes(table, lambda: apply_deletes(dest_config, table, deleted_rows, batch_size, dry_run, parallel,
+                                                           init_command))
+            else:
+                failed = sync_rows(src_connection, dest_connection, table, [], deleted_rows, True, batch_size, dry_run,
+                                   parallel)
+                failed_rows += 1 if failed is None else failed
+        print(colored(f"Table {table} synchronized to {name}: {len(changed_keys)} changed, {len(deleted_rows)} deleted", 'green'))
+        logging.info(f"Table {table} synchronized to {name}: {len(changed_keys)} changed, {len(deleted_rows)} deleted")
+        return failed_rows == 0
+    finally:
+        for connection in (src_connection, dest_connection):
+            if connection:
+                connection.close()
+
+def destination_needs_sync(dest_config, table, src_row_count, src_checksum):
+    dest_connection = create_new_connection(dest_config)
+    if not dest_connection:
+        print(colored(f"Failed to create connection for table {table} on {destination_name(dest_config)}", 'red'))
+        logging.error(f"Failed to create connection for table {table} on {destination_name(dest_config)}")
+        return None
+    try:
+        if not table_exists(dest_connection, table):
+            return True
+        return (get_table_row_count(dest_connection, table) != src_row_count or
+                get_row_checksum(dest_connection, table) != src_checksum)
+    finally:
+        dest_connection.close()
+
+def fan_out_table(src_config, dest_configs, table, batch_size, delete_missing, dry_run, parallel, foreign_key_checks=True,
+                  defer_deletes=None, seed_missing_tables=False):
+    try:
+        src_connection = create_new_connection(src_config)
+        if not src_connection:
+            print(colored(f"Failed to create connection for table {table}", 'red'))
+            return
+        failed = []
+
+        src_row_count = get_table_row_count(src_connection, table)
+        src_checksum = get_row_checksum(src_connection, table)
+        with ThreadPoolExecutor(max_workers=len(dest_configs)) as executor:
+            needs_sync = list(executor.map(lambda dest_config: destination_needs_sync(dest_config, table, src_row_count,
+                                                                                      src_checksum), dest_configs))
+        # An unreachable replica is reported as failed rather than treated as up to date
+        failed.extend(dest_config for dest_config, changed in zip(dest_configs, needs_sync) if changed is None)
+        targets = [dest_config for dest_config, changed in zip(dest_configs, needs_sync) if changed]
+
+        if targets:
+            diff_plan = get_diff_plan(src_connection, table)
+            table_schema = get_table_schema(src_connection, table)
+            src_dict = read_diff_snapshot(src_connection, table, diff_plan)
+            register, fetch = make_payload_fetcher(table, diff_plan, src_dict, batch_size)
+            init_command = None if foreign_key_checks else "SET SESSION FOREIGN_KEY_CHECKS=0"
+
+            with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+                futures = {executor.submit(sync_destination, src_config, dest_config, table, diff_plan, src_dict,
+                                           table_schema, register, fetch, batch_size, delete_missing, dry_run, parallel,
+                                           init_command, defer_deletes, seed_missing_tables): dest_config
+                           for dest_config in targets}
+                for future in as_completed(futures):
+                    try:
+                        if not future.result():
+                            failed.append(futures[future])
+                    except Exception as exc:
+                        log_error()
+                        failed.append(futures[future])
+        src_connection.close()
+
+        if failed:
+            names = ', '.join(destination_name(dest_config) for dest_config in failed)
+            print(colored(f"Table {table} failed to synchronize to {len(failed)} destinations: {names}", 'red'))
+            logging.error(f"Table {table} failed to synchronize to {len(failed)} destinations: {names}")
+    except Exception as e:
+        log_error()
+
 def has_table_changed(src_connection, dest_connection, table_name):
     try:
         src_row_count = get_table_row_count(src_connection, table_name)
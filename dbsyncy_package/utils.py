@@ -1,12 +1,17 @@
 # dbsyncy_package/utils.py
 from itertools import islice
+import datetime
 import logging
 import csv
+import os
+import re
 import shutil
 import sys
 import traceback
 from termcolor import colored
 
+LOAD_DATA_ESCAPES = {b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r', b'\0': b'\\0'}
+
 def log_error():
     exc_type, exc_value, exc_traceback = sys.exc_info()
     tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
@@ -58,6 +63,52 @@ def prepare_row(row, existing_columns, table_structure):
                 prepared_row[key] = f"'{str(value).replace("'", "''")}'"
     return prepared_row
 
+def format_time_value(value):
+    microseconds = (value.days * 86400 + value.seconds) * 1000000 + value.microseconds
+    sign = '-' if microseconds < 0 else ''
+    seconds, microseconds = divmod(abs(microseconds), 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    formatted = f"{sign}{hours}:{minutes:02}:{seconds:02}"
+    return f"{formatted}.{microseconds:06}" if microseconds else formatted
+
+def encode_load_data_value(value, hex_encode=False):
+    # Encodes a value for LOAD DATA's default format; binary columns are hex-encoded and UNHEXed on load
+    if value is None:
+        return b'\\N'
+    if isinstance(value, (bytes, bytearray)):
+        encoded = bytes(value)
+    else:
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, datetime.timedelta):
+            value = format_time_value(value)
+        elif isinstance(value, (set, frozenset)):
+            value = ','.join(sorted(value))
+        encoded = str(value).encode('utf-8')
+    if hex_encode:
+        return encoded.hex().encode('ascii')
+    return re.sub(rb'[\\\t\n\r\0]', lambda match: LOAD_DATA_ESCAPES[match.group(0)], encoded)
+
+def write_load_data_rows(file, rows, hex_flags):
+    for row in rows:
+        file.write(b'\t'.join(encode_load_data_value(value, flag) for value, flag in zip(row, hex_flags)) + b'\n')
+
+def load_data_file(connection, table_name, file_name, columns, binary_columns=()):
+    targets = ', '.join(f"@{column}" if column in binary_columns else column for column in columns)
+    assignments = ', '.join(f"{column} = UNHEX(@{column})" for column in columns if column in binary_columns)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        LOAD DATA LOCAL INFILE '{file_name}'
+        INTO TABLE {table_name}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+        LINES TERMINATED BY '\\n'
+        ({targets}){f" SET {assignments}" if assignments else ""};
+    """)
+    connection.commit()
+    return cursor.rowcount
+
 def get_row_checksum(connection, table_name):
     try:
         cursor = connection.cursor()
@@ -6,9 +6,22 @@ import traceback
 from dbsyncy_package import load_config, save_config, modify_config, sync_tables, setup_logging, setup_signal_handler
 from dbsyncy_package.database import create_connection, create_new_connection
 from dbsyncy_package.utils import get_tables, compress_and_copy_table
+from dbsyncy_package.snapshot import export_snapshot, import_snapshot
 from termcolor import colored
 
 
+def sync_options(config):
+    return dict(
+        batch_size=config["settings"]["batch_size"],
+        delete_missing=config["settings"]["delete_missing"],
+        dry_run=config["settings"]["dry_run"],
+        parallel=config["settings"]["parallel"],
+        foreign_key_checks=config["settings"].get("foreign_key_checks", True),
+        seed_missing_tables=config["settings"].get("seed_missing_tables", False),
+        changelog_tables=config["settings"].get("changelog_tables", [])
+    )
+
+
 def sync_hard_menu(config):
     while True:
         print("\n" + colored("Sync Database [Hard Sync]:", 'cyan', attrs=['bold']))
@@ -22,40 +35,19 @@ def sync_hard_menu(config):
         if choice == "1":
             print(colored("\nPushing data from Local to Remote...", 'cyan', attrs=['bold']))
             try:
-                sync_tables(
-                    config=config,
-                    direction='push',
-                    batch_size=config["settings"]["batch_size"],
-                    delete_missing=config["settings"]["delete_missing"],
-                    dry_run=config["settings"]["dry_run"],
-                    parallel=config["settings"]["parallel"]
-                )
+                sync_tables(config=config, direction='push', **sync_options(config))
             except Exception as e:
                 log_error("PUSH sync")
         elif choice == "2":
             print(colored("\nPulling data from Remote to Local...", 'cyan', attrs=['bold']))
             try:
-                sync_tables(
-                    config=config,
-                    direction='pull',
-                    batch_size=config["settings"]["batch_size"],
-                    delete_missing=config["settings"]["delete_missing"],
-                    dry_run=config["settings"]["dry_run"],
-                    parallel=config["settings"]["parallel"]
-                )
+                sync_tables(config=config, direction='pull', **sync_options(config))
             except Exception as e:
                 log_error("PULL sync")
         elif choice == "3":
             print(colored("\nSyncing data both ways...", 'cyan', attrs=['bold']))
             try:
-                sync_tables(
-                    config=config,
-                    direction='both',
-                    batch_size=config["settings"]["batch_size"],
-                    delete_missing=config["settings"]["delete_missing"],
-                    dry_run=config["settings"]["dry_run"],
-                    parallel=config["settings"]["parallel"]
-                )
+                sync_tables(config=config, direction='both', **sync_options(config))
             except Exception as e:
                 log_error("SYNC")
         elif choice == "4":
@@ -81,6 +73,30 @@ def sync_hard_menu(config):
             print(colored("Invalid choice. Please try again.", 'red', attrs=['bold']))
 
 
+def snapshot_menu(config):
+    while True:
+        print("\n" + colored("Snapshot Export/Import:", 'cyan', attrs=['bold']))
+        print(colored("1. EXPORT | local -> directory", 'blue'))
+        print(colored("2. IMPORT | directory -> remote", 'blue'))
+        print(colored("3. Back to Main Menu", 'blue'))
+        choice = input(colored("Enter your choice: ", 'cyan', attrs=['bold']))
+
+        if choice in ("1", "2"):
+            directory = input(colored("Enter snapshot directory: ", 'cyan'))
+            try:
+                if choice == "1":
+                    export_snapshot(config["local"], directory, parallel=config["settings"]["parallel"],
+                                    chunk_rows=config["settings"].get("snapshot_chunk_rows", 100000))
+                else:
+                    import_snapshot(config["remote"], directory, parallel=config["settings"]["parallel"])
+            except Exception as e:
+                log_error("SNAPSHOT")
+        elif choice == "3":
+            break
+        else:
+            print(colored("Invalid choice. Please try again.", 'red', attrs=['bold']))
+
+
 def log_error(context):
     exc_type, exc_value, exc_traceback = sys.exc_info()
     tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
@@ -102,6 +118,7 @@ def main():
         print(colored("2. Sync Database [Soft Sync]", 'blue'))
         print(colored("3. Sync Database Structure", 'blue'))
         print(colored("4. Settings", 'blue'))
+        print(colored("5. Snapshot Export/Import", 'blue'))
         print(colored("9. Exit", 'blue'))
         choice = input(colored("Enter your choice: ", 'cyan', attrs=['bold']))
 
@@ -113,6 +130,8 @@ def main():
             sync_structure_menu(config)
         elif choice == "4":
             modify_config(config)
+        elif choice == "5":
+            snapshot_menu(config)
         elif choice == "9":
             print(colored("Exiting...", 'cyan', attrs=['bold']))
             break